@@ -2,9 +2,11 @@
 
 import os
 import cv2
-import json
+import re
+import orjson
+import asyncio
+import av
 from dotenv import load_dotenv
-from PIL import Image, PngImagePlugin
 import google.generativeai as genai
 
 # --- Configuration & API Key Setup ---
@@ -19,73 +21,137 @@ try:
 except Exception as e:
     print(f"⚠️ Error configuring Google Gemini: {e}")
 
-# --- Main Service Functions ---
+# --- Prompts ---
+# The static instructions are sent as system instructions on the models below,
+# so each request only carries the frames or event details.
+VISION_SYSTEM_PROMPT = """
+Analyze this sequence of video frames for a public safety threat.
+Is a person showing clear signs of distress, struggling against another person,
+being forcibly moved, or being abducted?
+Respond ONLY in JSON format with two keys:
+1. 'threat_level': An integer from 1 to 10, where 1 is no threat and 10 is a definite, severe assault or abduction.
+2. 'description': A brief, 20-word summary of the action.
+Example response: {"threat_level": 8, "description": "A person is being forcibly dragged by another individual towards a vehicle against their will."}
+"""
+
+ALERT_SYSTEM_PROMPT = """
+You are a public safety alert system. Based on the event details you are given, generate a clear,
+concise emergency alert message suitable for law enforcement. Be direct and professional.
+**Crucially, the entire message must be under 450 characters to fit within 3 SMS segments.**
+"""
+
+# Create the models once and share them across requests instead of per call
+GEMINI_MODEL_NAME = "gemini-2.5-pro"
+_VISION_MODEL = genai.GenerativeModel(model_name=GEMINI_MODEL_NAME, system_instruction=VISION_SYSTEM_PROMPT)
+_TEXT_MODEL = genai.GenerativeModel(model_name=GEMINI_MODEL_NAME, system_instruction=ALERT_SYSTEM_PROMPT)
+
+# Optional hardware decoder for frame extraction, e.g. "cuda", "vaapi" or "videotoolbox".
+# Leave unset to use multi-threaded software decoding.
+VIDEO_HWACCEL = os.getenv("VIDEO_HWACCEL")
+
+# Gemini tiles images at 768px, so larger frames only cost upload bandwidth
+MAX_FRAME_DIMENSION = 768
+FRAME_JPEG_QUALITY = 85
+
+# Matches the outermost JSON object in a model response, ignoring any markdown fences around it
+_JSON_OBJECT_RE = re.compile(rb'\{.*\}', re.DOTALL)
+
+# --- Helper Functions ---
+
+def _open_video(video_path: str):
+    """
+    Opens a video with PyAV, using the configured hardware decoder when available.
+    """
+    if VIDEO_HWACCEL:
+        try:
+            from av.codec.hwaccel import HWAccel
+            hwaccel = HWAccel(device_type=VIDEO_HWACCEL, allow_software_fallback=True)
+            return av.open(video_path, hwaccel=hwaccel)
+        except Exception as e:
+            print(f"   - Hardware decoding '{VIDEO_HWACCEL}' unavailable, using software decode. Error: {e}")
+    return av.open(video_path)
 
-async def analyze_video_with_gpt4v(video_path: str, frames_to_extract: int = 10) -> dict | None:
+
+def _encode_frame(frame_bgr) -> dict | None:
     """
-    Analyzes a video using the Gemini 1.5 Flash model.
+    Downscales a BGR frame to MAX_FRAME_DIMENSION and encodes it as a JPEG image part.
+    Returns None if the frame could not be encoded.
     """
-    print(f"   [AI Service] Starting Gemini analysis for {video_path}...")
+    h, w = frame_bgr.shape[:2]
+    scale = MAX_FRAME_DIMENSION / max(h, w)
+    if scale < 1:
+        frame_bgr = cv2.resize(frame_bgr, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+
+    # Encode straight from the BGR array; no PIL image or PNG re-encode in between
+    success, jpeg = cv2.imencode('.jpg', frame_bgr, [int(cv2.IMWRITE_JPEG_QUALITY), FRAME_JPEG_QUALITY])
+    if not success:
+        return None
+    return {'mime_type': 'image/jpeg', 'data': jpeg.tobytes()}
+
+
+def extract_video_frames(video_path: str, frames_to_extract: int) -> list:
+    """
+    Decodes the video once, front to back, and returns frames spread evenly across the clip as JPEG image parts.
+    """
+    image_parts = []
+    with _open_video(video_path) as container:
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        total_frames = stream.frames
+        if not total_frames and stream.duration and stream.average_rate:
+            # Some containers don't store a frame count; estimate it from the duration
+            total_frames = int(stream.duration * stream.time_base * stream.average_rate)
 
-    # 1. Extract video frames as PIL.Image objects
-    pil_images = []
-    try:
-        video = cv2.VideoCapture(video_path)
-        total_frames = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
         # Ensure we don't try to extract more frames than exist
         frames_to_extract = min(frames_to_extract, total_frames)
         if frames_to_extract == 0:
-             print("   - Error: Video has no frames.")
-             video.release()
-             return None
+            return image_parts
+
+        frame_indices = {int(i * total_frames / frames_to_extract) for i in range(frames_to_extract)}
+        last_index = max(frame_indices)
+        for frame_index, frame in enumerate(container.decode(stream)):
+            if frame_index in frame_indices:
+                image_part = _encode_frame(frame.to_ndarray(format="bgr24"))
+                if image_part:
+                    image_parts.append(image_part)
+                else:
+                    print(f"   - Warning: Could not encode frame {frame_index}; skipping it.")
+            if frame_index >= last_index:
+                break
+
+    return image_parts
 
-        frame_indices = [int(i * total_frames / frames_to_extract) for i in range(frames_to_extract)]
+# --- Main Service Functions ---
 
-        for i in frame_indices:
-            video.set(cv2.CAP_PROP_POS_FRAMES, i)
-            success, frame = video.read()
-            if not success:
-                continue
-            # Convert frame from BGR (OpenCV) to RGB (PIL)
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            pil_images.append(Image.fromarray(frame_rgb))
+async def analyze_video_with_gpt4v(video_path: str, frames_to_extract: int = 10) -> dict | None:
+    """
+    Analyzes a video using the Gemini 1.5 Flash model.
+    """
+    print(f"   [AI Service] Starting Gemini analysis for {video_path}...")
 
-        video.release()
+    # 1. Extract video frames as downscaled JPEG image parts
+    # Decoding is CPU-bound, so run it in a worker thread to keep the event loop free.
+    try:
+        image_parts = await asyncio.to_thread(extract_video_frames, video_path, frames_to_extract)
 
-        if not pil_images:
+        if not image_parts:
             print("   - Error: Could not extract any frames from the video.")
             return None
 
-        print(f"   - Extracted {len(pil_images)} frames for analysis.")
+        print(f"   - Extracted {len(image_parts)} frames for analysis.")
 
     except Exception as e:
         print(f"   - Error processing video file: {e}")
         return None
 
-    # 2. Prepare the request for Gemini
-    # CHANGED: Using a valid and efficient model name.
-    model = genai.GenerativeModel(model_name="gemini-2.5-pro")
-
-    prompt = """
-    Analyze this sequence of video frames for a public safety threat.
-    Is a person showing clear signs of distress, struggling against another person,
-    being forcibly moved, or being abducted?
-    Respond ONLY in JSON format with two keys:
-    1. 'threat_level': An integer from 1 to 10, where 1 is no threat and 10 is a definite, severe assault or abduction.
-    2. 'description': A brief, 20-word summary of the action.
-    Example response: {"threat_level": 8, "description": "A person is being forcibly dragged by another individual towards a vehicle against their will."}
-    """
-
-    # The request must contain the prompt first, then all the images
-    request_contents = [prompt] + pil_images
-
-    # 3. Send the request to Google
+    # 2. Send the frames to Google; the instructions are the vision model's system prompt
     try:
-        response = await model.generate_content_async(request_contents)
-        # Clean up the response text to ensure it's valid JSON
-        response_text = response.text.strip().replace("```json", "").replace("```", "")
-
-        return json.loads(response_text)
+        response = await _VISION_MODEL.generate_content_async(image_parts)
+        # Pull the JSON object out of the response text, whatever formatting surrounds it
+        match = _JSON_OBJECT_RE.search(response.text.encode())
+        if match:
+            return orjson.loads(match.group(0))
+        print(f"   - Error: No JSON object found in the model response: {response.text}")
 
     except Exception as e:
         print(f"   - An unexpected error occurred during API call: {e}")
@@ -109,16 +175,8 @@ async def generate_alert_message(event_description: str, location: str, timestam
     """
     print("   [AI Service] Generating formatted alert message with location and time...")
 
-    # CHANGED: Using a valid and efficient model name.
-    model = genai.GenerativeModel(model_name="gemini-2.5-pro")
-
-    # MODIFICATION: The prompt now includes the location and timestamp
-    # This gives the AI context to generate a more complete alert.
+    # Only the event details are sent; the instructions are the text model's system prompt
     prompt = f"""
-    You are a public safety alert system. Based on the following event details, generate a clear,
-    concise emergency alert message suitable for law enforcement. Be direct and professional.
-    **Crucially, the entire message must be under 450 characters to fit within 3 SMS segments.**
-
     Event Time: {timestamp}
     Event Location: {location}
     Event Description: "{event_description}"
@@ -127,7 +185,7 @@ async def generate_alert_message(event_description: str, location: str, timestam
     """
 
     try:
-        response = await model.generate_content_async(prompt)
+        response = await _TEXT_MODEL.generate_content_async(prompt)
         return response.text.strip()
     except Exception as e:
         print(f"   - An unexpected error occurred during alert generation: {e}")
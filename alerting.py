@@ -1,10 +1,15 @@
 import os
 from dotenv import load_dotenv
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
 from twilio.base.exceptions import TwilioRestException
-from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail, Attachment, FileContent, FileName, FileType, Disposition
-import base64 
+import pybase64
+import boto3
+from botocore.config import Config
 from datetime import datetime
 # --- Configuration & Client Initialization ---
 load_dotenv()
@@ -19,22 +24,92 @@ RECIPIENT_PHONE_NUMBER = os.getenv("RECIPIENT_PHONE_NUMBER")
 SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY")
 FROM_EMAIL = os.getenv("FROM_EMAIL")
 TO_EMAIL = os.getenv("TO_EMAIL")
+SENDGRID_SEND_URL = "https://api.sendgrid.com/v3/mail/send"
+
+# S3 Configuration (optional). When set, evidence clips are uploaded and linked
+# in the email instead of being attached. AWS credentials are read by boto3.
+EVIDENCE_S3_BUCKET = os.getenv("EVIDENCE_S3_BUCKET")
+EVIDENCE_URL_EXPIRY_SECONDS = 24 * 60 * 60
+
+def _make_http_session() -> requests.Session:
+    """
+    Creates a keep-alive session so consecutive dispatches reuse the same TLS
+    connection instead of paying a new handshake on every alert.
+    """
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(total=2, backoff_factor=0.2)
+    ))
+    return session
+
+# One session per service: SMS and email are sent from separate worker threads at
+# the same time, and requests.Session is not documented as thread-safe.
+sendgrid_session = _make_http_session()
 
 # Initialize clients
 try:
-    twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    # pool_connections=False stops TwilioHttpClient from creating its own session,
+    # since it is replaced with our configured one right after.
+    twilio_http_client = TwilioHttpClient(pool_connections=False)
+    twilio_http_client.session = _make_http_session()
+    twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, http_client=twilio_http_client)
 except Exception as e:
     print(f"⚠️ Warning: Could not initialize Twilio client. Is it configured in .env? Error: {e}")
     twilio_client = None
 
-try:
-    sendgrid_client = SendGridAPIClient(SENDGRID_API_KEY)
-except Exception as e:
-    print(f"⚠️ Warning: Could not initialize SendGrid client. Is it configured in .env? Error: {e}")
-    sendgrid_client = None
+s3_client = None
+if EVIDENCE_S3_BUCKET:
+    try:
+        s3_client = boto3.client("s3", config=Config(tcp_keepalive=True))
+    except Exception as e:
+        print(f"⚠️ Warning: Could not initialize S3 client. Is it configured in .env? Error: {e}")
+
+# Read size for streaming the attachment through the base64 encoder.
+# Must be a multiple of 3 so each encoded block concatenates without padding.
+ATTACHMENT_CHUNK_SIZE = 3 * 1024 * 1024
 
 # --- Alerting Functions ---
 
+def encode_file_base64(file_path: str) -> str:
+    """
+    Base64-encodes a file in fixed-size blocks instead of reading it all at once.
+    Each block is decoded to str as it is encoded, so the raw file and the encoded
+    bytes never have to be held in memory in full alongside the final string.
+    """
+    parts = []
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(ATTACHMENT_CHUNK_SIZE)
+            if not block:
+                break
+            parts.append(pybase64.b64encode(block).decode('ascii'))
+    return ''.join(parts)
+
+
+def upload_evidence_to_s3(video_path: str) -> str | None:
+    """
+    Uploads the evidence clip to S3 and returns a presigned download URL.
+    Returns None if S3 is not configured or the upload fails.
+    """
+    if not s3_client:
+        return None
+    key = f"evidence/{os.path.basename(video_path)}"
+    try:
+        s3_client.upload_file(video_path, EVIDENCE_S3_BUCKET, key, ExtraArgs={'ContentType': 'video/mp4'})
+        url = s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': EVIDENCE_S3_BUCKET, 'Key': key},
+            ExpiresIn=EVIDENCE_URL_EXPIRY_SECONDS
+        )
+        print(f"      - Uploaded video evidence to s3://{EVIDENCE_S3_BUCKET}/{key}")
+        return url
+    except Exception as e:
+        print(f"      - ❌ S3 Upload Error: Could not upload {video_path}. Falling back to an attachment. Error: {e}")
+        return None
+
+
 def send_sms_alert(message: str, timestamp: str, location: str):
     """
     Sends an SMS alert using the Twilio API.
@@ -61,15 +136,23 @@ def send_email_alert(message: str, video_path: str, timestamp: str, location: st
     """
     Sends an email alert with details using the SendGrid API.
     """
-    if not all([sendgrid_client, FROM_EMAIL, TO_EMAIL]):
+    if not all([SENDGRID_API_KEY, FROM_EMAIL, TO_EMAIL]):
         print("   [Alerting Service] Email not sent: SendGrid is not fully configured in .env file.")
         return
         
     print(f"   [Alerting Service] Sending email to {TO_EMAIL}...")
     formatted_message = message.replace('\n', '<br>')
-    # For local testing, we'll just include the file path in the body.
-    # A production system would upload the video to cloud storage (e.g., S3)
-    # and include a public link here.
+    # Link the clip from S3 when configured so the email stays a small payload.
+    # Otherwise (e.g. local testing) fall back to attaching the file.
+    evidence_url = upload_evidence_to_s3(video_path)
+    if evidence_url:
+        expiry_hours = EVIDENCE_URL_EXPIRY_SECONDS // 3600
+        evidence_html = f"<p>A video clip of the event is available for {expiry_hours} hours: <a href='{evidence_url}'>View video evidence</a></p>"
+    else:
+        # The local path is only meaningful alongside the attachment; it is cleaned up after analysis
+        evidence_html = f"""<p>A video clip of the event is attached to this email for your review.</p>
+    <p><strong>Original File Path:</strong> <code>{video_path}</code></p>"""
+
     html_content = f"""
     <h3>Sentinel AI - High Priority Threat Alert</h3>
     <p>An automated threat detection system has identified a potential public safety incident.</p>
@@ -81,8 +164,7 @@ def send_email_alert(message: str, video_path: str, timestamp: str, location: st
     <blockquote style='border-left: 4px solid #cc0000; padding-left: 10px; margin-left: 5px;'>
       {formatted_message}
     </blockquote>
-    <p>A video clip of the event is attached to this email for your review.</p>
-    <p><strong>Original File Path:</strong> <code>{video_path}</code></p>
+    {evidence_html}
     <hr>
     <p><em>This is an automated message. Please review the evidence immediately.</em></p>
     """
@@ -94,35 +176,40 @@ def send_email_alert(message: str, video_path: str, timestamp: str, location: st
         html_content=html_content
     )
 
-    try:
-        with open(video_path, 'rb') as f:
-            video_data = f.read()
-        
-        # Encode the video data to base64
-        encoded_file = base64.b64encode(video_data).decode()
-
-        # Create the attachment object
-        attachedFile = Attachment(
-            FileContent(encoded_file),
-            FileName(os.path.basename(video_path)),
-            FileType('video/mp4'),
-            Disposition('attachment')
-        )
-        message_obj.attachment = attachedFile
-        print(f"      - Attached video file: {video_path}")
+    if not evidence_url:
+        try:
+            # Encode the video data to base64
+            encoded_file = encode_file_base64(video_path)
 
-    except FileNotFoundError:
-        print(f"      - ❌ Attachment Error: Video file not found at {video_path}. Email will be sent without it.")
-    except Exception as e:
-        print(f"      - ❌ An unexpected error occurred while attaching the file: {e}")
-    # --- End of new attachment logic ---
+            # Create the attachment object
+            attachedFile = Attachment(
+                FileContent(encoded_file),
+                FileName(os.path.basename(video_path)),
+                FileType('video/mp4'),
+                Disposition('attachment')
+            )
+            message_obj.attachment = attachedFile
+            print(f"      - Attached video file: {video_path}")
+
+        except FileNotFoundError:
+            print(f"      - ❌ Attachment Error: Video file not found at {video_path}. Email will be sent without it.")
+        except Exception as e:
+            print(f"      - ❌ An unexpected error occurred while attaching the file: {e}")
+        # --- End of new attachment logic ---
 
     try:
-        response = sendgrid_client.send(message_obj)
+        # Post the mail payload over the shared session rather than through
+        # SendGridAPIClient, whose urllib transport opens a new connection per send.
+        response = sendgrid_session.post(
+            SENDGRID_SEND_URL,
+            json=message_obj.get(),
+            headers={"Authorization": f"Bearer {SENDGRID_API_KEY}"},
+            timeout=30
+        )
         if 200 <= response.status_code < 300:
             print(f"      - Email sent successfully! Status Code: {response.status_code}")
         else:
-            print(f"      - ❌ SendGrid API Error: Failed to send email. Status: {response.status_code}, Body: {response.body}")
+            print(f"      - ❌ SendGrid API Error: Failed to send email. Status: {response.status_code}, Body: {response.text}")
     except Exception as e:
         print(f"      - ❌ An unexpected error occurred while sending email: {e}")
 
@@ -1,4 +1,5 @@
 import asyncio
+import re
 import time
 import requests # NEW: Import requests for location fetching
 from datetime import datetime
@@ -10,13 +11,26 @@ import alerting
 # --- Configuration ---
 THREAT_SCORE_THRESHOLD = 7 # Trigger alert if GPT-4V score is above this (e.g., 7 out of 10)
 ALERT_KEYWORDS = ["help", "stop", "get away", "danger", "assault", "kidnap"]
+# All keywords compiled into one case-insensitive pattern so a transcript is scanned once
+_ALERT_KEYWORDS_RE = re.compile("|".join(map(re.escape, ALERT_KEYWORDS)), re.IGNORECASE)
 
-def get_location_info():
+LOCATION_CACHE_TTL_SECONDS = 3600 # The server is fixed, so its IP location rarely changes
+LOCATION_REQUEST_TIMEOUT = 2
+
+# Keep-alive session and cached result for the ipinfo.io lookup
+location_session = requests.Session()
+_location_cache = {"value": None, "ts": 0.0}
+
+def get_location_info(session: requests.Session = location_session):
     """
     Gets the approximate location based on the public IP address using ipinfo.io.
+    Successful lookups are cached for LOCATION_CACHE_TTL_SECONDS.
     """
+    if _location_cache["value"] and time.time() - _location_cache["ts"] < LOCATION_CACHE_TTL_SECONDS:
+        return _location_cache["value"]
+
     try:
-        response = requests.get("https://ipinfo.io/json")
+        response = session.get("https://ipinfo.io/json", timeout=LOCATION_REQUEST_TIMEOUT)
         response.raise_for_status() # Raise an exception for bad status codes
         data = response.json()
         # Format a user-friendly location string
@@ -24,11 +38,37 @@ def get_location_info():
         region = data.get("region", "Unknown Region")
         country = data.get("country", "Unknown Country")
         loc = data.get("loc", "N/A") # Lat/Long
-        return f"{city}, {region}, {country} (approx. coordinates: {loc})"
+        location = f"{city}, {region}, {country} (approx. coordinates: {loc})"
+        _location_cache["value"] = location
+        _location_cache["ts"] = time.time()
+        return location
     except requests.exceptions.RequestException as e:
         print(f"⚠️  Could not fetch location: {e}")
         return "Location could not be determined."
     
+def assess_vision_result(vision_result) -> str | None:
+    """
+    Returns the threat reason if the vision analysis scores above the threshold, else None.
+    """
+    # Note: Assumes vision_result is a dict like {'threat_level': 8, 'description': '...'}
+    try:
+        if vision_result and vision_result.get("threat_level", 0) > THREAT_SCORE_THRESHOLD:
+            return f"High threat score ({vision_result['threat_level']}) detected. Description: {vision_result.get('description', 'N/A')}"
+    except (TypeError, AttributeError):
+        print("⚠️ Warning: Could not parse vision result. It might not be a valid dictionary.")
+    return None
+
+def assess_audio_result(audio_result: str) -> str | None:
+    """
+    Returns the threat reason if the transcription contains an alert keyword, else None.
+    """
+    if not audio_result:
+        return None
+    keyword_match = _ALERT_KEYWORDS_RE.search(audio_result)
+    if keyword_match:
+        return f"Alert keyword ('{keyword_match.group(0).lower()}') detected in audio."
+    return None
+
 async def run_analysis(video_path: str, audio_path: str | None):
     """
     Orchestrates the analysis of video and audio files concurrently.
@@ -39,56 +79,56 @@ async def run_analysis(video_path: str, audio_path: str | None):
         print(f"🎵 With audio: {audio_path}")
 
     # --- 1. Concurrent API Calls ---
-    # Prepare the tasks to be run at the same time.
-    video_analysis_task = ai_services.analyze_video_with_gpt4v(video_path)
-    
+    # Run both analyses as tasks. As soon as either one confirms a threat on its own,
+    # the other is cancelled: it can no longer change the outcome, and skipping the
+    # slower Gemini vision call saves both latency and API spend.
+    vision_result = None
+    audio_result = "" # No transcription available
+    vision_reason = None
+    audio_reason = None
+
+    vision_task = asyncio.create_task(ai_services.analyze_video_with_gpt4v(video_path))
+    pending = {vision_task}
+    audio_task = None
     if audio_path:
-        audio_analysis_task = ai_services.transcribe_audio_with_whisper(audio_path)
-        # Use asyncio.gather to run both tasks concurrently
-        results = await asyncio.gather(video_analysis_task, audio_analysis_task)
-        vision_result, audio_result = results
-    else:
-        # If there's no audio, just run the video analysis
-        vision_result = await video_analysis_task
-        audio_result = "" # No transcription available
-        
+        audio_task = asyncio.create_task(ai_services.transcribe_audio_with_whisper(audio_path))
+        pending.add(audio_task)
+
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        if vision_task in done:
+            vision_result = vision_task.result()
+            vision_reason = assess_vision_result(vision_result)
+        if audio_task in done:
+            audio_result = audio_task.result()
+            audio_reason = assess_audio_result(audio_result)
+        if pending and (vision_reason or audio_reason):
+            for task in pending:
+                task.cancel()
+            print("⏩ Threat already confirmed; skipping the remaining analysis.")
+            break
+
     print(f"\n[AI Service Results]")
     print(f"Vision Analysis: {vision_result}")
     print(f"Audio Transcription: '{audio_result}'")
 
     # --- 2. Threat Assessment ---
-    threat_detected = False
-    threat_reason = ""
-
-    # Check threat level from video analysis
-    # Note: Assumes vision_result is a dict like {'threat_level': 8, 'description': '...'}
-    try:
-        if vision_result and vision_result.get("threat_level", 0) > THREAT_SCORE_THRESHOLD:
-            threat_detected = True
-            threat_reason = f"High threat score ({vision_result['threat_level']}) detected. Description: {vision_result.get('description', 'N/A')}"
-    except (TypeError, AttributeError):
-        print("⚠️ Warning: Could not parse vision result. It might not be a valid dictionary.")
-
-
-    # Check for keywords in audio transcription, but only if a threat hasn't already been confirmed
-    if not threat_detected and audio_result:
-        transcription_lower = audio_result.lower()
-        for keyword in ALERT_KEYWORDS:
-            if keyword in transcription_lower:
-                threat_detected = True
-                threat_reason = f"Alert keyword ('{keyword}') detected in audio."
-                break # Stop checking after the first keyword is found
+    # Vision takes priority; audio keywords are only used if vision didn't confirm a threat
+    threat_reason = vision_reason or audio_reason
+    threat_detected = threat_reason is not None
 
     # --- 3. Trigger Actions ---
     if threat_detected:
         print(f"\n🚨🚨🚨 THREAT DETECTED! Reason: {threat_reason} 🚨🚨🚨")
         event_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S IST")
-        event_location = get_location_info()
+        # The lookup is blocking, so run it in a worker thread to keep the event loop free
+        event_location = await asyncio.to_thread(get_location_info)
         print(f"📍 Location: {event_location}")
         print(f"🕒 Timestamp: {event_time}")
         
         # A. Generate a clear alert message for authorities
-        event_description = vision_result.get('description', 'A potential threat was detected.')
+        # The vision result may be missing if audio confirmed the threat first
+        event_description = (vision_result or {}).get('description', 'A potential threat was detected.')
         
         # CORRECTED: Pass the location and timestamp to the alert generation function.
         alert_message = await ai_services.generate_alert_message(
@@ -101,20 +141,23 @@ async def run_analysis(video_path: str, audio_path: str | None):
 
         # B. Dispatch alerts
         print("Dispatching alerts via SMS and Email...")
-        
-        # CORRECTED: Pass the timestamp and location to the SMS alert function.
-        alerting.send_sms_alert(
-            message=alert_message,
-            timestamp=event_time,
-            location=event_location
-        )
-        
-        # CORRECTED: Pass the timestamp and location to the email alert function.
-        alerting.send_email_alert(
-            message=alert_message,
-            video_path=video_path,
-            timestamp=event_time,
-            location=event_location
+
+        # The Twilio and SendGrid calls are blocking, so run them in worker
+        # threads concurrently to overlap their network round-trips.
+        await asyncio.gather(
+            asyncio.to_thread(
+                alerting.send_sms_alert,
+                message=alert_message,
+                timestamp=event_time,
+                location=event_location
+            ),
+            asyncio.to_thread(
+                alerting.send_email_alert,
+                message=alert_message,
+                video_path=video_path,
+                timestamp=event_time,
+                location=event_location
+            )
         )
 
     else:
@@ -3,8 +3,10 @@
 import uvicorn
 from fastapi import FastAPI, File, UploadFile, BackgroundTasks
 import os
-import shutil
-from moviepy import VideoFileClip # Corrected import
+import sys
+import asyncio
+import aiofiles
+import subprocess
 import time
 from datetime import datetime
 import decision_engine
@@ -18,6 +20,13 @@ TEMP_DIR = "temp_files"
 os.makedirs(EVIDENCE_DIR, exist_ok=True)
 os.makedirs(TEMP_DIR, exist_ok=True)
 
+# Chunk size used when streaming uploads to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Audio is only extracted when it will actually be transcribed.
+# transcribe_audio_with_whisper is currently a stub, so this is off by default.
+TRANSCRIPTION_ENABLED = os.getenv("TRANSCRIPTION_ENABLED", "false").lower() == "true"
+
 # --- Background Tasks ---
 def cleanup_files(file_paths: list):
     """
@@ -27,12 +36,16 @@ def cleanup_files(file_paths: list):
     time.sleep(10) # Wait 10 seconds
     print("🧹 Starting cleanup task...")
     for path in file_paths:
-        if path and os.path.exists(path):
-            try:
-                os.remove(path)
-                print(f"   - Removed processed file: {path}")
-            except OSError as e:
-                print(f"   - Error removing file {path}: {e}")
+        if not path:
+            continue
+        # Remove directly instead of checking os.path.exists first: one syscall per file
+        try:
+            os.remove(path)
+            print(f"   - Removed processed file: {path}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"   - Error removing file {path}: {e}")
     print("✅ Cleanup finished.")
 
 
@@ -50,27 +63,39 @@ async def analyze_video_clip(background_tasks: BackgroundTasks, video_file: Uplo
     temp_video_path = os.path.join(TEMP_DIR, f"{timestamp}_{video_file.filename}")
     
     try:
-        with open(temp_video_path, "wb") as buffer:
-            shutil.copyfileobj(video_file.file, buffer)
+        # Write in chunks asynchronously so large uploads don't block the event loop
+        async with aiofiles.open(temp_video_path, "wb") as buffer:
+            while chunk := await video_file.read(UPLOAD_CHUNK_SIZE):
+                await buffer.write(chunk)
         print(f"📹 Video saved temporarily to: {temp_video_path}")
     except Exception as e:
         return {"status": "error", "message": f"Failed to save video file: {e}"}
 
     # 2. Extract the audio track
     temp_audio_path = None
-    try:
-        # Use a more robust check for video file integrity
-        with VideoFileClip(temp_video_path) as video_clip:
-            if video_clip.audio:
-                # Keep audio temporary, as it's only used for transcription
-                base, _ = os.path.splitext(os.path.basename(temp_video_path))
-                temp_audio_path = os.path.join(TEMP_DIR, f"{base}.mp3")
-                video_clip.audio.write_audiofile(temp_audio_path, logger=None)
+    audio_path = None
+    if TRANSCRIPTION_ENABLED:
+        # Keep audio temporary, as it's only used for transcription
+        base, _ = os.path.splitext(os.path.basename(temp_video_path))
+        audio_path = os.path.join(TEMP_DIR, f"{base}.m4a")
+        try:
+            # Copy the audio stream out as-is with ffmpeg; no re-encoding needed.
+            # Run it as an async subprocess so the event loop isn't blocked meanwhile.
+            proc = await asyncio.create_subprocess_exec(
+                "ffmpeg", "-y", "-loglevel", "error", "-i", temp_video_path, "-vn", "-acodec", "copy", audio_path,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE
+            )
+            _, stderr = await proc.communicate()
+            if proc.returncode == 0 and os.path.exists(audio_path):
+                temp_audio_path = audio_path
                 print(f"🎤 Audio extracted and saved temporarily to: {temp_audio_path}")
             else:
-                print("🔇 No audio track found in the video.")
-    except Exception as e:
-        print(f"⚠️ Warning: Could not extract audio from {temp_video_path}. Error: {e}")
+                error = stderr.decode(errors="replace").strip()
+                print(f"⚠️ Warning: ffmpeg exited with code {proc.returncode} while extracting audio "
+                      f"(the clip may have no audio track). Error: {error}")
+        except Exception as e:
+            print(f"⚠️ Warning: Could not extract audio from {temp_video_path}. Error: {e}")
 
     # 3. Call the Decision Engine as a background task
     # This allows us to return a response immediately without waiting for AI analysis.
@@ -82,7 +107,8 @@ async def analyze_video_clip(background_tasks: BackgroundTasks, video_file: Uplo
 
     # 4. Schedule the cleanup task to run after the analysis
     # CHANGED: Add the temporary video path to the cleanup list as well.
-    files_to_clean = [temp_video_path, temp_audio_path]
+    # audio_path is cleaned even if extraction failed, in case ffmpeg left a partial file.
+    files_to_clean = [temp_video_path, audio_path]
     background_tasks.add_task(cleanup_files, file_paths=files_to_clean)
 
     # 5. Return an immediate confirmation response
@@ -104,6 +130,17 @@ def read_root():
 # This block allows you to run the server directly with the command 'python main.py'
 if __name__ == "__main__":
     print("🚀 Starting Sentinel AI FastAPI server...")
-    # reload=True will automatically restart the server when you save changes
+    # Set UVICORN_RELOAD=true during development to restart the server when you save changes.
+    # Otherwise run one worker per CPU so clips from several cameras are handled in parallel.
+    reload = os.getenv("UVICORN_RELOAD", "false").lower() == "true"
     # Use 0.0.0.0 to make it accessible from other devices on your network
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        reload=reload,
+        workers=None if reload else os.cpu_count(),
+        # uvloop isn't available on Windows; "auto" falls back to asyncio there
+        loop="uvloop" if sys.platform != "win32" else "auto",
+        http="httptools"
+    )
@@ -2,9 +2,11 @@
 
 import cv2
 import requests
+from requests.adapters import HTTPAdapter
+from requests_toolbelt import MultipartEncoder
+import subprocess
 import time
 import os
-import collections
 import numpy as np
 
 # --- Configuration ---
@@ -15,13 +17,19 @@ VIDEO_SOURCE = "test_videos/kiddnapping-simulation.mp4"
 # The default is http://127.0.0.1:8000, and the endpoint is /analyze.
 BACKEND_URL = "http://127.0.0.1:8000/analyze"
 
+# Reuse one keep-alive connection to the backend across clips
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
 # Frame settings
 FRAME_WIDTH = 640
 FRAME_HEIGHT = 480
 FPS = 20.0
 
 # Motion detection settings
-MOTION_THRESHOLD = 500  # Lower value means more sensitive to motion
+# Number of changed pixels (after dilation) needed to count as motion; lower value means more sensitive.
+# 1 matches the previous pixel-sum threshold of 500 (i.e. at least two 255-valued pixels).
+MOTION_THRESHOLD = 1
 BLUR_SIZE = (21, 21)
 MIN_MOTION_FRAMES = 8 # Number of consecutive frames with motion to trigger a recording
 
@@ -29,15 +37,53 @@ MIN_MOTION_FRAMES = 8 # Number of consecutive frames with motion to trigger a re
 PRE_MOTION_BUFFER_SECONDS = 10  # How many seconds of video to keep before motion
 POST_MOTION_RECORD_SECONDS = 5   # How many seconds to record after motion stops
 
+# Clip encoding settings (ffmpeg). Use ["-c:v", "h264_nvenc", "-preset", "p1"] on NVIDIA GPUs.
+VIDEO_CODEC_ARGS = ["-c:v", "libx264", "-preset", "ultrafast"]
+VIDEO_BITRATE = "2M"
+
+def save_clip(frames, clip_filename):
+    """Encodes the frames to an H.264 MP4 by piping raw BGR frames into ffmpeg."""
+    command = [
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-f", "rawvideo", "-pix_fmt", "bgr24",
+        "-s", f"{FRAME_WIDTH}x{FRAME_HEIGHT}", "-r", str(FPS),
+        "-i", "-",
+        *VIDEO_CODEC_ARGS, "-b:v", VIDEO_BITRATE, "-pix_fmt", "yuv420p",
+        clip_filename
+    ]
+    try:
+        # Leaving the with-block closes ffmpeg's stdin and waits for it, even if a write fails
+        with subprocess.Popen(command, stdin=subprocess.PIPE) as proc:
+            for f in frames:
+                # Frames are contiguous, so write their buffers directly without a copy
+                proc.stdin.write(f.data)
+        if proc.returncode == 0:
+            return
+        print(f"⚠️ ffmpeg exited with code {proc.returncode}. Falling back to OpenCV's mp4v writer.")
+    except OSError as e:
+        print(f"⚠️ Could not encode with ffmpeg ({e}). Falling back to OpenCV's mp4v writer.")
+
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    out = cv2.VideoWriter(clip_filename, fourcc, FPS, (FRAME_WIDTH, FRAME_HEIGHT))
+    for f in frames:
+        out.write(f)
+    out.release()
+
 def send_clip_to_backend(video_path):
     """Sends the captured video clip to the FastAPI backend."""
     # CHANGED: The print statement now shows the correct full URL.
     print(f"📡 Sending clip '{video_path}' to the backend server at {BACKEND_URL}...")
     try:
         with open(video_path, 'rb') as f:
-            files = {'video_file': (os.path.basename(video_path), f, 'video/mp4')}
+            # Stream the multipart body from the file; requests' files= would read it all into memory
+            body = MultipartEncoder(fields={'video_file': (os.path.basename(video_path), f, 'video/mp4')})
             # NOTE: The URL already includes the /analyze endpoint from the config above.
-            response = requests.post(BACKEND_URL, files=files, timeout=60) # Increased timeout for analysis
+            response = SESSION.post(
+                BACKEND_URL,
+                data=body,
+                headers={'Content-Type': body.content_type},
+                timeout=60 # Increased timeout for analysis
+            )
 
             if response.status_code == 200:
                 print(f"✅ Clip sent successfully. Server response: {response.json()}")
@@ -65,9 +111,19 @@ def run_simulator():
         print(f"❌ Error: Could not open video source '{VIDEO_SOURCE}'.")
         return
 
-    # Initialize frame buffer using deque for efficient appends and pops from both ends
+    # Initialize the pre-motion ring buffer as a fixed pool of preallocated frames.
+    # Frames are resized straight into the next slot, so nothing is allocated per frame.
     buffer_size = PRE_MOTION_BUFFER_SECONDS * int(FPS)
-    frame_buffer = collections.deque(maxlen=buffer_size)
+    frame_pool = [np.empty((FRAME_HEIGHT, FRAME_WIDTH, 3), np.uint8) for _ in range(buffer_size)]
+    frames_buffered = 0
+
+    # Preallocate the motion detection buffers once and reuse them for every frame
+    gray_buf = np.empty((FRAME_HEIGHT, FRAME_WIDTH), np.uint8)
+    blur_buf = np.empty_like(gray_buf)
+    avg_buf = np.empty_like(gray_buf)
+    delta_buf = np.empty_like(gray_buf)
+    thresh_buf = np.empty_like(gray_buf)
+    dilated_buf = np.empty_like(gray_buf)
 
     avg_frame = None
     motion_counter = 0
@@ -81,28 +137,28 @@ def run_simulator():
             print("End of video stream.")
             break
 
-        frame = cv2.resize(frame, (FRAME_WIDTH, FRAME_HEIGHT))
-
         # 1. Store current frame in buffer
-        frame_buffer.append(frame.copy())
+        frame = cv2.resize(frame, (FRAME_WIDTH, FRAME_HEIGHT), dst=frame_pool[frames_buffered % buffer_size])
+        frames_buffered += 1
 
         # 2. Motion Detection Logic
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        gray = cv2.GaussianBlur(gray, BLUR_SIZE, 0)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray_buf)
+        cv2.GaussianBlur(gray_buf, BLUR_SIZE, 0, dst=blur_buf)
 
         if avg_frame is None:
-            avg_frame = gray.copy().astype("float")
+            avg_frame = blur_buf.astype("float")
             continue
 
-        cv2.accumulateWeighted(gray, avg_frame, 0.5)
-        frame_delta = cv2.absdiff(gray, cv2.convertScaleAbs(avg_frame))
-        thresh = cv2.threshold(frame_delta, 25, 255, cv2.THRESH_BINARY)[1]
-        thresh = cv2.dilate(thresh, None, iterations=2)
+        cv2.accumulateWeighted(blur_buf, avg_frame, 0.5)
+        cv2.convertScaleAbs(avg_frame, dst=avg_buf)
+        cv2.absdiff(blur_buf, avg_buf, dst=delta_buf)
+        cv2.threshold(delta_buf, 25, 255, cv2.THRESH_BINARY, dst=thresh_buf)
+        cv2.dilate(thresh_buf, None, dst=dilated_buf, iterations=2)
 
-        motion_sum = np.sum(thresh)
+        motion_count = cv2.countNonZero(dilated_buf)
 
         motion_detected = False
-        if motion_sum > MOTION_THRESHOLD:
+        if motion_count > MOTION_THRESHOLD:
             motion_counter += 1
             if motion_counter >= MIN_MOTION_FRAMES:
                 motion_detected = True
@@ -125,17 +181,16 @@ def run_simulator():
                 post_motion_frames.append(frame_rec)
 
             # Combine pre-motion buffer with post-motion frames
-            full_clip_frames = list(frame_buffer) + post_motion_frames
+            if frames_buffered < buffer_size:
+                pre_motion_frames = frame_pool[:frames_buffered]
+            else:
+                oldest = frames_buffered % buffer_size
+                pre_motion_frames = frame_pool[oldest:] + frame_pool[:oldest]
+            full_clip_frames = pre_motion_frames + post_motion_frames
 
             # Save the combined clip
             clip_filename = f"clip_{int(time.time())}.mp4"
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            out = cv2.VideoWriter(clip_filename, fourcc, FPS, (FRAME_WIDTH, FRAME_HEIGHT))
-
-            for f in full_clip_frames:
-                out.write(f)
-
-            out.release()
+            save_clip(full_clip_frames, clip_filename)
             print(f"📹 Clip saved as '{clip_filename}'.")
 
             # 4. Send to Backend
@@ -145,7 +200,7 @@ def run_simulator():
             is_recording = False
             motion_counter = 0
             # Clear buffer to avoid immediate re-trigger on the same event
-            frame_buffer.clear()
+            frames_buffered = 0
 
         # Display the live feed (optional)
         cv2.imshow("Live Feed", frame)